@@ -0,0 +1,17 @@
+# Generated by Django 3.1.3 on 2026-10-17 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_auto_20201118_2237'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['site', 'updated', 'id'], name='core_product_site_updated'),
+        ),
+    ]
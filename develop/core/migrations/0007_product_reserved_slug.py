@@ -0,0 +1,19 @@
+# Generated by Django 3.1.3 on 2026-10-17 15:21
+
+from django.db import migrations
+import vendor.models.base
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_product_site_updated'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='slug',
+            field=vendor.models.base.ReservedSlugField(editable=False, populate_from='name', unique_with=('site__id',)),
+        ),
+    ]
@@ -0,0 +1,46 @@
+"""
+Data generators used to build larger data sets than the fixtures for the benchmarks.
+"""
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from datetime import timedelta
+
+from core.models import Product
+from vendor.cache import price_schedule_cache
+from vendor.models import Offer, Price, Invoice, OrderItem, CustomerProfile
+
+User = get_user_model()
+
+
+def create_profiles(count, prefix="benchmark"):
+    """
+    Creates count users, each with a customer profile on the current site.
+    """
+    users = [User.objects.create_user(f"{prefix}-{i}", f"{prefix}-{i}@example.com", "password") for i in range(count)]
+    return [CustomerProfile.objects.create(user=user) for user in users]
+
+
+def create_offers(count, prices_per_offer=2, prefix="Benchmark"):
+    """
+    Creates count available offers, each with its own product and prices_per_offer prices, the highest priority being the current one.
+    """
+    now = timezone.now()
+    offers = []
+    for i in range(count):
+        product = Product.objects.create(name=f"{prefix} Product {i}", available=True, meta={'msrp': {'default': 'usd', 'usd': 20.00 + i}})
+        offer = Offer.objects.create(name=f"{prefix} Offer {i}", start_date=now - timedelta(days=1), available=True)
+        offer.products.add(product)
+        Price.objects.bulk_create([Price(offer=offer, cost=10.00 + i + priority, start_date=now - timedelta(days=1), priority=priority) for priority in range(prices_per_offer)])
+        price_schedule_cache.invalidate(offer.pk)        # bulk_create doesn't send the signals that invalidate it
+        offers.append(offer)
+    return offers
+
+
+def create_cart(profile, offers, status=Invoice.InvoiceStatus.CART):
+    """
+    Creates an invoice with an order item for each offer, priced and totaled.
+    """
+    invoice = Invoice.objects.create(profile=profile, status=status)
+    OrderItem.objects.bulk_create([OrderItem(invoice=invoice, offer=offer) for offer in offers])
+    invoice.recalculate()
+    return invoice
@@ -0,0 +1,150 @@
+"""
+Benchmarks for the checkout flow.
+
+Every measured call records the number of queries, the wall time and the peak memory allocated
+and fails when it goes over its budget in BUDGETS.  Carts of different sizes are measured so a
+query count that grows with the cart shows up as a failure on the larger carts.
+
+Set the VENDOR_BENCHMARK_REPORT environment variable to print the measurements.
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+from django.contrib.sites.models import Site
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.tests.generators import create_profiles, create_offers, create_cart
+from vendor.forms import BillingAddressForm, CreditCardForm
+from vendor.models import Invoice
+from vendor.processors.dummy import DummyProcessor
+
+CART_SIZES = [1, 10, 25]
+
+# queries: max number of queries, seconds: max wall time, memory: max peak of allocated bytes
+BUDGETS = {
+    'cart': {'queries': 10, 'seconds': 2.0, 'memory': 4 * 1024 * 1024},
+    'add-to-cart': {'queries': 14, 'seconds': 2.0, 'memory': 4 * 1024 * 1024},
+    'checkout-review': {'queries': 11, 'seconds': 2.0, 'memory': 4 * 1024 * 1024},
+    'checkout-review-post': {'queries': 11, 'seconds': 2.0, 'memory': 4 * 1024 * 1024},
+    'manager-order-list': {'queries': 5, 'seconds': 2.0, 'memory': 4 * 1024 * 1024},
+    'manager-order-detail': {'queries': 8, 'seconds': 2.0, 'memory': 4 * 1024 * 1024},
+    'authorize-payment': {'queries': 1, 'seconds': 1.0, 'memory': 1024 * 1024},
+}
+
+BILLING_ADDRESS = {'name':'Home','company':'Whitemoon Dreams','country':'581','address_1':'221B Baker Street','address_2':'','locality':'Marylebone','state':'California','postal_code':'90292'}
+CREDIT_CARD = {'full_name':'Bob Ross','card_number':'5424000000000015','expire_month':'12','expire_year':'2030','cvv_number':'900','payment_type':'10'}
+
+
+class CheckoutBenchmarkTests(TestCase):
+
+    results = []
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profiles = create_profiles(len(CART_SIZES) + 1)
+        cls.offers = create_offers(max(CART_SIZES) + 1)
+        cls.carts = {size: create_cart(profile, cls.offers[:size]) for size, profile in zip(CART_SIZES, cls.profiles)}
+
+        cls.staff_profile = cls.profiles[-1]
+        for size in CART_SIZES:
+            create_cart(cls.staff_profile, cls.offers[:size], status=Invoice.InvoiceStatus.COMPLETE)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if os.environ.get('VENDOR_BENCHMARK_REPORT'):
+            sys.stderr.write("\n{:<24} {:>6} {:>8} {:>10} {:>10}\n".format('benchmark', 'size', 'queries', 'ms', 'peak kb'))
+            for name, size, queries, seconds, memory in cls.results:
+                sys.stderr.write("{:<24} {:>6} {:>8} {:>10.1f} {:>10.0f}\n".format(name, size, queries, seconds * 1000, memory / 1024))
+
+    def setUp(self):
+        Site.objects.get_current()
+
+    def get_client(self, invoice):
+        client = Client()
+        client.force_login(invoice.profile.user)
+        return client
+
+    def measure(self, name, size, func):
+        """
+        Runs func, records its cost and checks it against the budget.
+        """
+        tracemalloc.start()
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            result = func()
+        seconds = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        self.results.append((name, size, len(queries), seconds, memory))
+
+        budget = BUDGETS[name]
+        self.assertLessEqual(len(queries), budget['queries'], "{} with {} items ran {} queries:\n{}".format(name, size, len(queries), "\n".join(query['sql'] for query in queries.captured_queries)))
+        self.assertLessEqual(seconds, budget['seconds'], "{} with {} items took {:.3f}s".format(name, size, seconds))
+        self.assertLessEqual(memory, budget['memory'], "{} with {} items peaked at {} bytes".format(name, size, memory))
+        return result
+
+    def set_checkout_session(self, client):
+        billing_address = BillingAddressForm(BILLING_ADDRESS)
+        billing_address.is_valid()
+        credit_card = CreditCardForm(CREDIT_CARD)
+        credit_card.is_valid()
+
+        session = client.session
+        session['billing_address_form'] = billing_address.cleaned_data
+        session['credit_card_form'] = credit_card.cleaned_data
+        session.save()
+
+    def test_cart_view(self):
+        for size, cart in self.carts.items():
+            client = self.get_client(cart)
+            response = self.measure('cart', size, lambda: client.get(reverse('vendor:cart')))
+            self.assertEquals(response.status_code, 200)
+
+    def test_add_to_cart_view(self):
+        offer = self.offers[-1]
+        for size, cart in self.carts.items():
+            client = self.get_client(cart)
+            response = self.measure('add-to-cart', size, lambda: client.post(offer.add_to_cart_link()))
+            self.assertEquals(response.status_code, 302)
+
+    def test_checkout_review_view(self):
+        for size, cart in self.carts.items():
+            client = self.get_client(cart)
+            self.set_checkout_session(client)
+            response = self.measure('checkout-review', size, lambda: client.get(reverse('vendor:checkout-review')))
+            self.assertEquals(response.status_code, 200)
+
+    def test_checkout_review_post_view(self):
+        for size, cart in self.carts.items():
+            client = self.get_client(cart)
+            self.set_checkout_session(client)
+            response = self.measure('checkout-review-post', size, lambda: client.post(reverse('vendor:checkout-review')))
+            self.assertEquals(response.status_code, 302)
+
+    def test_manager_order_list_view(self):
+        client = Client()
+        client.force_login(self.staff_profile.user)
+        response = self.measure('manager-order-list', len(CART_SIZES), lambda: client.get(reverse('vendor_admin:manager-order-list')))
+        self.assertEquals(response.status_code, 200)
+
+    def test_manager_order_detail_view(self):
+        client = Client()
+        client.force_login(self.staff_profile.user)
+        for size, cart in self.carts.items():
+            response = self.measure('manager-order-detail', size, lambda: client.get(reverse('vendor_admin:manager-order-detail', kwargs={'uuid': cart.uuid})))
+            self.assertEquals(response.status_code, 200)
+
+    def test_dummy_authorize_payment(self):
+        for size, cart in self.carts.items():
+            processor = DummyProcessor(cart)
+            processor.get_billing_address_form_data(BILLING_ADDRESS, BillingAddressForm)
+            processor.get_payment_info_form_data(CREDIT_CARD, CreditCardForm)
+            self.measure('authorize-payment', size, processor.authorize_payment)
+            self.assertTrue(processor.transaction_submitted)
@@ -1,7 +1,10 @@
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
-from django.test import TestCase, Client
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, Client
 from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
 
 from core.models import Product
 
@@ -14,6 +17,7 @@ class ModelCustomerProfileTests(TestCase):
     fixtures = ['user', 'unit_test']
 
     def setUp(self):
+        cache.clear()
         self.user = User(username='test', first_name='Bob', last_name='Ross', password='helloworld')
         self.user.save()
         self.customer_profile = CustomerProfile()
@@ -69,6 +73,13 @@ class ModelCustomerProfileTests(TestCase):
 
         self.assertEquals(count, 3)
 
+    def test_get_cart_items_count_cached(self):
+        customer_profile = CustomerProfile.objects.get(pk=1)
+        customer_profile.get_cart_items_count()
+
+        with self.assertNumQueries(0):
+            self.assertEquals(customer_profile.get_cart_items_count(), 3)
+
     def test_owns_product_true(self):
         product = Product.objects.get(pk=2)
         self.assertTrue(self.customer_profile_existing.has_product(product))
@@ -77,6 +88,20 @@ class ModelCustomerProfileTests(TestCase):
         product = Product.objects.get(pk=1)
         self.assertFalse(self.customer_profile_existing.has_product(product))
 
+    def test_owns_product_cached(self):
+        products = list(Product.objects.filter(pk__in=[1, 2]))
+        self.customer_profile_existing.has_product(products)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(self.customer_profile_existing.has_product(products))
+
+    def test_owns_product_expired_receipt(self):
+        product = Product.objects.get(pk=1)
+        receipt = Receipt.objects.create(profile=self.customer_profile_existing, order_item=OrderItem.objects.get(pk=5), start_date=timezone.now() - timedelta(days=2), end_date=timezone.now() - timedelta(days=1))
+        receipt.products.add(product)
+
+        self.assertFalse(self.customer_profile_existing.has_product(product))
+
     def test_get_checkout_cart(self):
         cp = CustomerProfile.objects.get(pk=1)
         invoice = cp.get_cart()
@@ -103,3 +128,41 @@ class ModelCustomerProfileTests(TestCase):
 class ViewCustomerProfileTests(TestCase):
     def setUp(self):
         pass
+
+
+class CustomerProfileCacheInvalidationTests(TransactionTestCase):
+    '''
+    The caches are invalidated when the transaction commits, these tests commit every save.
+    '''
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        cache.clear()
+        self.customer_profile_existing = CustomerProfile.objects.get(pk=1)
+
+    def test_get_cart_items_count_invalidated_on_cart_change(self):
+        customer_profile = CustomerProfile.objects.get(pk=1)
+        cart = customer_profile.get_cart()
+        self.assertEquals(customer_profile.get_cart_items_count(), 3)
+
+        cart.add_offer(Offer.objects.get(pk=4))
+        self.assertEquals(customer_profile.get_cart_items_count(), 4)
+
+        cart.remove_offer(Offer.objects.get(pk=4))
+        self.assertEquals(customer_profile.get_cart_items_count(), 3)
+
+        cart.status = Invoice.InvoiceStatus.COMPLETE
+        cart.save()
+        self.assertEquals(customer_profile.get_cart_items_count(), 0)
+
+    def test_owns_product_invalidated_on_receipt_change(self):
+        product = Product.objects.get(pk=1)
+        self.assertFalse(self.customer_profile_existing.has_product(product))
+
+        receipt = Receipt.objects.create(profile=self.customer_profile_existing, order_item=OrderItem.objects.get(pk=5), start_date=timezone.now())
+        receipt.products.add(product)
+        self.assertTrue(self.customer_profile_existing.has_product(product))
+
+        receipt.products.remove(product)
+        self.assertFalse(self.customer_profile_existing.has_product(product))
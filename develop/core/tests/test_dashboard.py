@@ -1,7 +1,14 @@
+import csv
+import gzip
+
 from django.contrib.auth import get_user_model
+from django.contrib.sites.models import Site
 from django.test import TestCase, Client
+from django.utils import timezone
 from django.urls import reverse
 
+from vendor.models import Invoice, Offer, Receipt, SalesDailyAggregate
+
 
 User = get_user_model()
 
@@ -21,9 +28,91 @@ class DashboardViewTests(TestCase):
         self.assertEquals(response.status_code, 200)
         self.assertContains(response, 'Admin Purchase Dashboard')
 
+    def test_view_dashboard_daily_sales(self):
+        SalesDailyAggregate.objects.add(1, timezone.localdate(), 'usd', 1, count=2, revenue=20.0)
+        SalesDailyAggregate.objects.add(1, timezone.localdate(), 'usd', 2, count=1, revenue=5.5)
+
+        response = self.client.get(reverse("vendor_admin:manager-dashboard"))
+
+        self.assertEquals(len(response.context['daily_sales']), 1)
+        self.assertEquals(response.context['daily_sales'][0]['count'], 3)
+        self.assertContains(response, '$25.50')
+
+    def test_view_order_list_current_site(self):
+        profile = Invoice.objects.get(pk=1).profile
+        invoice = Invoice.objects.create(profile=profile, status=Invoice.InvoiceStatus.COMPLETE)
+        other_site_invoice = Invoice.objects.create(profile=profile, site=Site.objects.create(domain='other.example.com', name='Other'), status=Invoice.InvoiceStatus.COMPLETE)
+
+        response = self.client.get(reverse("vendor_admin:manager-order-list"))
+
+        self.assertEquals(response.status_code, 200)
+        self.assertIn(invoice, response.context['object_list'])
+        self.assertNotIn(other_site_invoice, response.context['object_list'])
+        self.assertTrue(all(order.status > Invoice.InvoiceStatus.CART for order in response.context['object_list']))
+
     def test_view_dashboard_status_code_fail_no_login(self):
         client = Client()
         response = client.get(reverse("vendor_admin:manager-dashboard"))
         
         self.assertEquals(response.status_code, 302)
         self.assertIn('login', response.url)
+
+
+class ReportCSVViewTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.get(pk=1)
+        self.client.force_login(self.user)
+
+    def get_rows(self, response):
+        return list(csv.reader(b"".join(response.streaming_content).decode('utf-8').splitlines()))
+
+    def test_reciept_csv_rows(self):
+        response = self.client.get(reverse("vendor_admin:manager-reciept-download"))
+        rows = self.get_rows(response)
+
+        self.assertEquals(rows[0][0], "RECIEPT_ID")
+        self.assertEquals(len(rows), Receipt.objects.count() + 1)
+        self.assertEquals(rows[1][2], Receipt.objects.get(pk=1).profile.user.username)
+
+    def test_reciept_csv_date_filter(self):
+        response = self.client.get(reverse("vendor_admin:manager-reciept-download"), {'start_date': '2100-01-01'})
+
+        self.assertEquals(len(self.get_rows(response)), 1)
+
+    def test_reciept_csv_invalid_date(self):
+        response = self.client.get(reverse("vendor_admin:manager-reciept-download"), {'start_date': 'yesterday'})
+
+        self.assertEquals(response.status_code, 400)
+
+    def test_reciept_csv_impossible_date(self):
+        response = self.client.get(reverse("vendor_admin:manager-reciept-download"), {'end_date': '2020-02-30'})
+
+        self.assertEquals(response.status_code, 400)
+
+    def test_invoice_csv_status_filter(self):
+        response = self.client.get(reverse("vendor_admin:manager-invoice-download"), {'status': Invoice.InvoiceStatus.COMPLETE})
+        self.assertEquals(len(self.get_rows(response)), 1)
+
+        response = self.client.get(reverse("vendor_admin:manager-invoice-download"), {'status': Invoice.InvoiceStatus.CART})
+        self.assertEquals(len(self.get_rows(response)), 2)
+
+    def test_invoice_csv_gzip(self):
+        response = self.client.get(reverse("vendor_admin:manager-invoice-download"), HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEquals(response['Content-Encoding'], 'gzip')
+        content = gzip.decompress(b"".join(response.streaming_content)).decode('utf-8')
+        self.assertTrue(content.startswith("INVOICE_ID"))
+
+    def test_sales_csv_rows(self):
+        SalesDailyAggregate.objects.add(1, timezone.localdate(), 'usd', 1, count=2, revenue=20.0)
+        SalesDailyAggregate.objects.add(1, timezone.localdate(), 'usd', 1, refunds=10.0)
+
+        response = self.client.get(reverse("vendor_admin:manager-sales-download"), {'start_date': timezone.localdate().isoformat()})
+        rows = self.get_rows(response)
+
+        self.assertEquals(rows[0][0], "DATE")
+        self.assertEquals(rows[1], [timezone.localdate().isoformat(), 'usd', '1', Offer.objects.get(pk=1).name, '2', '20.00', '10.00'])
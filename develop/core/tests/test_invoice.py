@@ -1,11 +1,22 @@
 from django.contrib.auth import get_user_model
 from django.contrib.sites.models import Site
-from django.test import TestCase, Client, override_settings
+from django.test import TestCase, Client, RequestFactory, override_settings
 from django.urls import reverse
 from django.conf import settings
-
-from vendor.models import Offer, Price, Invoice, OrderItem, Receipt, CustomerProfile, Payment
+from django.db import connection
+from django.core.management import call_command
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+
+from vendor.models import Offer, Price, Invoice, OrderItem, Receipt, CustomerProfile, Payment, IdempotencyKey
 from vendor.forms import BillingAddressForm, CreditCardForm
+from vendor.processors.tasks import CHECKOUT_STATUSES, claim_invoice, run_authorization
+from vendor.management.commands.vendor_reprice_carts import Command as RepriceCartsCommand
+from vendor.signals import convert_session_cart_to_invoice
+from vendor.views.vendor import ReviewCheckoutView
 
 User = get_user_model()
 class ModelInvoiceTests(TestCase):
@@ -57,9 +68,9 @@ class ModelInvoiceTests(TestCase):
         self.existing_invoice.update_totals()
         remove_shirt_total = self.existing_invoice.total
 
-        self.assertEquals(start_total, 345.18)
-        self.assertEquals(add_mug_total, 355.18)
-        self.assertEquals(remove_shirt_total, 345.19)
+        self.assertEquals(start_total, Decimal('345.18'))
+        self.assertEquals(add_mug_total, Decimal('355.18'))
+        self.assertEquals(remove_shirt_total, Decimal('345.19'))
 
     def test_add_quantity(self):
         self.shirt_offer.allow_multiple = True
@@ -84,6 +95,157 @@ class ModelInvoiceTests(TestCase):
 
         self.assertNotEquals(start_quantity, end_quantity)
 
+    def test_add_offer_incremental_totals(self):
+        self.new_invoice.add_offer(self.mug_offer)
+        self.new_invoice.add_offer(self.shirt_offer)
+        incremental_subtotal = self.new_invoice.subtotal
+
+        self.assertEquals(Invoice.objects.get(pk=self.new_invoice.pk).total, self.new_invoice.total)
+
+        self.new_invoice.update_totals()
+
+        self.assertAlmostEqual(incremental_subtotal, self.new_invoice.subtotal, places=2)
+
+    def test_add_offer_concurrent_totals(self):
+        other_request_invoice = Invoice.objects.get(pk=self.new_invoice.pk)
+
+        self.new_invoice.add_offer(self.mug_offer)
+        other_request_invoice.add_offer(self.shirt_offer)
+
+        expected = self.mug_offer.current_price() + self.shirt_offer.current_price()
+        invoice = Invoice.objects.get(pk=self.new_invoice.pk)
+        self.assertEquals((invoice.subtotal, invoice.total), (expected, expected))
+        self.assertEquals(other_request_invoice.total, expected)
+
+    def test_update_totals_sums_in_database(self):
+        self.new_invoice.add_offer(self.mug_offer)
+        self.new_invoice.add_offer(self.shirt_offer)
+        expected = self.mug_offer.current_price() + self.shirt_offer.current_price()
+
+        with self.assertNumQueries(1):
+            self.new_invoice.update_totals()
+        self.assertEquals(self.new_invoice.subtotal, expected)
+
+        self.new_invoice.order_items.filter(offer=self.mug_offer).update(unit_price=None)
+        self.new_invoice.update_totals()
+        self.assertEquals(self.new_invoice.subtotal, expected)
+
+    def test_invoice_totals_are_exact(self):
+        for cost in ['0.10', '0.20', '0.30']:
+            Invoice.objects.create(profile=self.new_invoice.profile, status=Invoice.InvoiceStatus.COMPLETE, subtotal=Decimal(cost), tax=0, shipping=0, total=Decimal(cost))
+
+        totals = Invoice.objects.filter(status=Invoice.InvoiceStatus.COMPLETE, total__lt=1).totals()
+
+        self.assertEquals(totals['total'], Decimal('0.60'))
+        self.assertEquals(totals['subtotal'], Decimal('0.60'))
+
+    def test_remove_offer_incremental_totals(self):
+        self.new_invoice.add_offer(self.mug_offer)
+        self.new_invoice.add_offer(self.shirt_offer)
+        self.new_invoice.remove_offer(self.mug_offer)
+
+        self.assertEquals(Invoice.objects.get(pk=self.new_invoice.pk).subtotal, self.shirt_offer.current_price())
+
+    def test_add_offer_stores_unit_price(self):
+        order_item = self.new_invoice.add_offer(self.hamster)
+
+        self.assertEquals(order_item.unit_price, self.hamster.current_price())
+
+    def test_recalculate_reprices_order_items(self):
+        order_item = self.new_invoice.add_offer(self.mug_offer)
+        Price.objects.create(offer=self.mug_offer, cost=5.0, start_date=timezone.now() - timedelta(days=1), priority=10)
+
+        self.new_invoice.recalculate()
+        order_item.refresh_from_db()
+
+        self.assertEquals(order_item.unit_price, 5.0)
+        self.assertEquals(Invoice.objects.get(pk=self.new_invoice.pk).subtotal, 5.0)
+
+    def test_order_item_price_uses_snapshot(self):
+        order_item = self.new_invoice.add_offer(self.mug_offer)
+        order_item = OrderItem.objects.get(pk=order_item.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEquals(order_item.total, order_item.unit_price)
+
+    def test_reprice_carts_command(self):
+        order_item = self.new_invoice.add_offer(self.mug_offer)
+        Price.objects.create(offer=self.mug_offer, cost=5.0, start_date=timezone.now() - timedelta(days=1), priority=10)
+
+        call_command('vendor_reprice_carts', '--offer', str(self.mug_offer.uuid), stdout=StringIO())
+        order_item.refresh_from_db()
+
+        self.assertEquals(order_item.unit_price, 5.0)
+        self.assertEquals(Invoice.objects.get(pk=self.new_invoice.pk).total, 5.0)
+
+    def test_reprice_carts_command_skips_checkout(self):
+        order_item = self.new_invoice.add_offer(self.mug_offer)
+        self.new_invoice.status = Invoice.InvoiceStatus.CHECKOUT
+        self.new_invoice.save()
+        Price.objects.create(offer=self.mug_offer, cost=5.0, start_date=timezone.now() - timedelta(days=1), priority=10)
+
+        call_command('vendor_reprice_carts', stdout=StringIO())
+        order_item.refresh_from_db()
+
+        self.assertEquals(order_item.unit_price, 10.0)
+
+    def test_reprice_carts_command_rechecks_status(self):
+        order_item = self.new_invoice.add_offer(self.mug_offer)
+        Price.objects.create(offer=self.mug_offer, cost=5.0, start_date=timezone.now() - timedelta(days=1), priority=10)
+        Invoice.objects.filter(pk=self.new_invoice.pk).update(status=Invoice.InvoiceStatus.CHECKOUT)       # Checked out after the carts were listed
+
+        command = RepriceCartsCommand(stdout=StringIO())
+        repriced = command.reprice_invoices([self.new_invoice.pk])
+        order_item.refresh_from_db()
+
+        self.assertEquals(repriced, 0)
+        self.assertEquals(order_item.unit_price, 10.0)
+
+    def test_reprice_carts_backfill_only_carts(self):
+        cart_item = self.new_invoice.add_offer(self.mug_offer)
+        completed = Invoice.objects.create(profile=self.new_invoice.profile, status=Invoice.InvoiceStatus.COMPLETE)
+        completed_item = OrderItem.objects.create(invoice=completed, offer=self.mug_offer)
+        OrderItem.objects.filter(pk__in=[cart_item.pk, completed_item.pk]).update(unit_price=None)
+
+        call_command('vendor_reprice_carts', '--backfill', stdout=StringIO())
+
+        self.assertIsNotNone(OrderItem.objects.get(pk=cart_item.pk).unit_price)
+        self.assertIsNone(OrderItem.objects.get(pk=completed_item.pk).unit_price)
+
+
+@skipUnless(connection.vendor == 'sqlite', "Query plans are checked on SQLite")
+class InvoiceIndexTests(TestCase):
+    """
+    Checks the hot lookups are answered by their index, so a change to the queries or the indexes that loses them fails here.
+    """
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        self.profile = CustomerProfile.objects.get(pk=1)
+
+    def test_cart_lookup_uses_profile_status_index(self):
+        self.assertIn('USING INDEX vendor_invoice_profile_status', self.profile.invoices.carts().explain())
+
+    def test_order_history_uses_site_updated_index(self):
+        plan = Invoice.objects.filter(site=Site.objects.get_current()).purchased().order_by('-updated', '-id').explain()
+
+        self.assertIn('USING INDEX vendor_invoice_site_updated', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_active_receipts_use_profile_dates_index(self):
+        plan = self.profile.receipts.filter(end_date__gte=timezone.now()).explain()
+
+        self.assertIn('USING INDEX vendor_receipt_profile_dates', plan)
+
+    def test_get_cart_or_checkout_cart_prefers_checkout(self):
+        cart = self.profile.get_cart_or_checkout_cart()
+        cart.status = Invoice.InvoiceStatus.CHECKOUT
+        cart.save()
+
+        with self.assertNumQueries(1):
+            self.assertEquals(self.profile.get_cart_or_checkout_cart(), cart)
+
 
 class CartViewTests(TestCase):
 
@@ -132,6 +294,41 @@ class CartViewTests(TestCase):
         remove_shirt_url = reverse("vendor:remove-from-cart", kwargs={'slug': self.shirt_offer.slug})
         self.assertContains(response, f'<span class="text-primary">${self.invoice.total}</span>')
     
+    def test_view_anonymous_cart(self):
+        client = Client()
+        client.post(self.mug_offer.add_to_cart_link())
+        client.post(self.shirt_offer.add_to_cart_link())
+        client.post(self.shirt_offer.add_to_cart_link())
+
+        with self.assertNumQueries(3):
+            response = client.get(self.cart_url)
+
+        self.assertEquals(len(response.context['order_items']), 2)
+        self.assertEquals(response.context['invoice']['total'], self.mug_offer.current_price() + self.shirt_offer.current_price())
+
+    def test_view_anonymous_cart_remove_missing_offer(self):
+        client = Client()
+        response = client.post(self.mug_offer.remove_from_cart_link())
+
+        self.assertRedirects(response, self.cart_url)
+
+    def test_login_merges_session_cart(self):
+        client = Client()
+        client.post(self.mug_offer.add_to_cart_link())
+        client.post(self.shirt_offer.add_to_cart_link())
+        shirt_quantity = self.invoice.order_items.get(offer=self.shirt_offer).quantity
+
+        request = RequestFactory().get('/')
+        request.session = client.session
+        request.user = self.user
+        convert_session_cart_to_invoice(sender=User, request=request)
+
+        self.invoice.refresh_from_db()
+        self.assertNotIn('session_cart', request.session)
+        self.assertEquals(self.invoice.order_items.get(offer=self.mug_offer).quantity, 1)
+        self.assertEquals(self.invoice.order_items.get(offer=self.shirt_offer).quantity, shirt_quantity)
+        self.assertAlmostEqual(self.invoice.subtotal, sum([order_item.total for order_item in self.invoice.order_items.with_prices()]))
+
     # def test_view_displays_login_instead_checkout(self):
         # raise NotImplementedError()
     
@@ -157,6 +354,12 @@ class AccountInformationViewTests(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertRedirects(response, reverse('account_login')+ '?next=' + self.view_url )
 
+    def test_view_freezes_order_item_prices(self):
+        self.client.get(self.view_url)
+
+        self.assertFalse(self.invoice.order_items.filter(unit_price=None).exists())
+        self.assertEquals(Invoice.objects.get(pk=1).status, Invoice.InvoiceStatus.CHECKOUT)
+
     # def test_view_cart_no_shipping_address(self):
         # raise NotImplementedError()
 
@@ -260,6 +463,51 @@ class ReviewCheckoutViewTests(TestCase):
         response = self.client.post(self.view_url)
 
         self.assertRedirects(response, reverse('vendor:purchase-summary', kwargs={'pk': 1}))
+
+    def test_view_async_checkout_queues_invoice(self):
+        with mock.patch.object(ReviewCheckoutView, 'async_checkout', True), mock.patch('vendor.processors.tasks.get_executor') as get_executor:
+            response = self.client.post(self.view_url)
+
+        self.invoice.refresh_from_db()
+        self.assertEquals(self.invoice.status, Invoice.InvoiceStatus.QUEUED)
+        self.assertTrue(get_executor.return_value.submit.called)
+        self.assertRedirects(response, reverse('vendor:checkout-status', kwargs={'uuid': self.invoice.uuid}), fetch_redirect_response=False)
+
+    def test_view_replayed_submission_returns_first_result(self):
+        with mock.patch('vendor.processors.tasks.authorize_checkout', side_effect=lambda processor: setattr(processor, 'transaction_submitted', True)) as authorize_checkout:
+            response = self.client.post(self.view_url, {'idempotency_key': 'abc123'})
+            replayed = self.client.post(self.view_url, {'idempotency_key': 'abc123'})
+
+        summary_url = reverse('vendor:purchase-summary', kwargs={'pk': self.invoice.pk})
+        self.assertEquals(authorize_checkout.call_count, 1)
+        self.assertRedirects(response, summary_url, fetch_redirect_response=False)
+        self.assertRedirects(replayed, summary_url, fetch_redirect_response=False)
+        self.assertEquals(IdempotencyKey.objects.get(key='abc123').redirect_url, summary_url)
+
+    def test_view_replayed_submission_in_progress_waits(self):
+        IdempotencyKey.objects.create(profile=self.invoice.profile, key='abc123', invoice=self.invoice)
+
+        with mock.patch('vendor.processors.tasks.authorize_checkout') as authorize_checkout:
+            response = self.client.post(self.view_url, HTTP_IDEMPOTENCY_KEY='abc123')
+
+        self.assertFalse(authorize_checkout.called)
+        self.assertRedirects(response, reverse('vendor:checkout-status', kwargs={'uuid': self.invoice.uuid}), fetch_redirect_response=False)
+
+    def test_view_submission_not_claimed_keeps_status_page(self):
+        with mock.patch('vendor.views.vendor.claim_invoice', return_value=False), mock.patch('vendor.processors.tasks.authorize_checkout') as authorize_checkout:
+            response = self.client.post(self.view_url, HTTP_IDEMPOTENCY_KEY='abc123')
+
+        status_url = reverse('vendor:checkout-status', kwargs={'uuid': self.invoice.uuid})
+        self.assertFalse(authorize_checkout.called)
+        self.assertRedirects(response, status_url, fetch_redirect_response=False)
+        self.assertEquals(IdempotencyKey.objects.get(key='abc123').redirect_url, status_url)
+
+    def test_claim_invoice_once(self):
+        self.assertTrue(claim_invoice(self.invoice, CHECKOUT_STATUSES, Invoice.InvoiceStatus.QUEUED))
+        self.assertFalse(claim_invoice(Invoice.objects.get(pk=self.invoice.pk), CHECKOUT_STATUSES, Invoice.InvoiceStatus.QUEUED))
+
+        self.invoice.refresh_from_db()
+        self.assertEquals(self.invoice.status, Invoice.InvoiceStatus.QUEUED)
     
     # def test_view_cart_no_shipping_address(self):
         # raise NotImplementedError()
@@ -274,6 +522,111 @@ class ReviewCheckoutViewTests(TestCase):
         # raise NotImplementedError()
     
 
+class CheckoutStatusViewTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.get(pk=1)
+        self.client.force_login(self.user)
+        self.invoice = Invoice.objects.get(pk=1)
+        self.invoice.status = Invoice.InvoiceStatus.QUEUED
+        self.invoice.save()
+        self.view_url = reverse('vendor:checkout-status', kwargs={'uuid': self.invoice.uuid})
+
+        billing_address = BillingAddressForm({'name':'Home','company':'Whitemoon Dreams','country':'581','address_1':'221B Baker Street','address_2':'','locality':'Marylebone','state':'California','postal_code':'90292'})
+        billing_address.is_valid()
+        payment_info = CreditCardForm({'full_name':'Bob Ross','card_number':'5424000000000015','expire_month':'12','expire_year':'2030','cvv_number':'900','payment_type':'10'})
+        payment_info.is_valid()
+        self.billing_address_data = billing_address.cleaned_data
+        self.payment_info_data = payment_info.cleaned_data
+
+    def test_view_status_code_200(self):
+        response = self.client.get(self.view_url)
+        self.assertEquals(response.status_code, 200)
+        self.assertContains(response, "(function poll()", count=1)
+
+    def test_view_status_pending(self):
+        response = self.client.get(self.view_url, {'format': 'json'})
+        self.assertEquals(response.json(), {'status': 'pending', 'redirect_url': None})
+
+    def test_view_other_customer_not_found(self):
+        self.client.force_login(User.objects.get(pk=2))
+        response = self.client.get(self.view_url, {'format': 'json'})
+        self.assertEquals(response.status_code, 404)
+
+    def test_run_authorization_complete(self):
+        Invoice.objects.filter(pk=self.invoice.pk).update(total=0)      # Free payments are completed by the base processor
+
+        run_authorization(self.invoice.pk, self.billing_address_data, self.payment_info_data)
+
+        response = self.client.get(self.view_url, {'format': 'json'})
+
+        self.invoice.refresh_from_db()
+        self.assertEquals(self.invoice.status, Invoice.InvoiceStatus.COMPLETE)
+        self.assertEquals(response.json(), {'status': 'complete', 'redirect_url': reverse('vendor:purchase-summary', kwargs={'pk': self.invoice.pk})})
+
+    def test_run_authorization_keeps_processor_status(self):
+        run_authorization(self.invoice.pk, self.billing_address_data, self.payment_info_data)
+
+        self.invoice.refresh_from_db()
+        self.assertEquals(self.invoice.status, Invoice.InvoiceStatus.PROCESSING)      # The base processor charges nothing and sets no status
+
+    def test_run_authorization_error_before_charge_returns_to_cart(self):
+        with mock.patch('vendor.processors.tasks.authorize_checkout', side_effect=ConnectionError):
+            run_authorization(self.invoice.pk, self.billing_address_data, self.payment_info_data)
+
+        self.invoice.refresh_from_db()
+        self.assertEquals(self.invoice.status, Invoice.InvoiceStatus.CART)
+
+    def test_run_authorization_error_after_charge_keeps_invoice(self):
+        def charge_then_fail(processor):
+            processor.transaction_submitted = True
+            processor.update_invoice_status(Invoice.InvoiceStatus.COMPLETE)
+            raise ValueError("Receipts failed")
+
+        with mock.patch('vendor.processors.tasks.authorize_checkout', side_effect=charge_then_fail):
+            processor = run_authorization(self.invoice.pk, self.billing_address_data, self.payment_info_data)
+
+        self.invoice.refresh_from_db()
+        self.assertTrue(processor.transaction_submitted)
+        self.assertEquals(self.invoice.status, Invoice.InvoiceStatus.COMPLETE)
+
+    def test_run_authorization_invalid_data_returns_to_cart(self):
+        run_authorization(self.invoice.pk, BillingAddressForm().initial, CreditCardForm().initial)
+
+        response = self.client.get(self.view_url)
+
+        self.invoice.refresh_from_db()
+        self.assertEquals(self.invoice.status, Invoice.InvoiceStatus.CART)
+        self.assertRedirects(response, reverse('vendor:checkout-account'))
+
+    def test_release_stranded_invoices(self):
+        stranded = Invoice.objects.create(profile=CustomerProfile.objects.get(pk=2), status=Invoice.InvoiceStatus.PROCESSING)
+        Invoice.objects.filter(pk__in=[self.invoice.pk, stranded.pk]).update(updated=timezone.now() - timedelta(hours=1))
+        recent = Invoice.objects.create(profile=CustomerProfile.objects.get(pk=2), status=Invoice.InvoiceStatus.QUEUED)
+
+        out = StringIO()
+        call_command('vendor_release_checkouts', timeout=60, stdout=out)
+
+        self.assertIn("Released 1 invoices", out.getvalue())
+        self.assertEquals(Invoice.objects.get(pk=stranded.pk).status, Invoice.InvoiceStatus.CHECKOUT)
+        self.assertEquals(Invoice.objects.get(pk=self.invoice.pk).status, Invoice.InvoiceStatus.QUEUED)     # Has a successful payment
+        self.assertEquals(Invoice.objects.get(pk=recent.pk).status, Invoice.InvoiceStatus.QUEUED)
+
+    def test_clear_idempotency_keys(self):
+        expired = IdempotencyKey.objects.create(profile=self.invoice.profile, key='abc123', invoice=self.invoice)
+        IdempotencyKey.objects.filter(pk=expired.pk).update(created=timezone.now() - timedelta(days=2))
+        kept = IdempotencyKey.objects.create(profile=self.invoice.profile, key='def456', invoice=self.invoice)
+
+        out = StringIO()
+        call_command('vendor_clear_idempotency_keys', retention=24 * 60 * 60, stdout=out)
+
+        self.assertIn("Deleted 1 idempotency keys", out.getvalue())
+        self.assertEquals(list(IdempotencyKey.objects.values_list('pk', flat=True)), [kept.pk])
+
+
 class PaymentSummaryViewTests(TestCase):
 
     fixtures = ['user', 'unit_test']
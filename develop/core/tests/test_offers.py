@@ -1,10 +1,17 @@
 from django.contrib.auth.models import User  #TODO: CHANGE TO GET_USER_MODEL
 from django.contrib.sites.models import Site
-from django.test import TestCase, Client
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, Client
 from django.urls import reverse
 from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 from core.models import Product
+from core.tests.generators import create_offers
+from vendor.cache import catalog_cache
 from vendor.models import Offer, Price, OrderItem
+from vendor.views.vendor_admin import AdminOfferListView
 
 
 class ModelOfferTests(TestCase):
@@ -54,7 +61,7 @@ class ModelOfferTests(TestCase):
     def test_get_current_price_is_msrp(self):
         offer = Offer.objects.get(pk=4)
         price = offer.current_price('mxn')
-        self.assertEquals(price, 21.12)
+        self.assertEquals(price, Decimal('21.12'))
     
     def test_get_current_price_is_msrp_default(self):
         offer = Offer.objects.get(pk=4)
@@ -67,11 +74,11 @@ class ModelOfferTests(TestCase):
 
     def test_get_current_price_is_between_start_end_date(self):
         offer = Offer.objects.get(pk=3)
-        self.assertEquals(offer.current_price(), 25.2)
+        self.assertEquals(offer.current_price(), Decimal('25.20'))
     
     def test_get_current_price_acording_to_priority(self):
         offer = Offer.objects.get(pk=3)
-        self.assertEquals(offer.current_price(), 25.2)
+        self.assertEquals(offer.current_price(), Decimal('25.20'))
 
     def test_offer_negative_savings(self):
         offer = Offer.objects.get(pk=3)
@@ -141,7 +148,78 @@ class ModelOfferTests(TestCase):
         offer = Offer.objects.get(pk=4)
 
         self.assertEquals(offer.get_best_currency('jpy'), 'usd')
-    
+
+    def test_with_current_price_matches_current_price(self):
+        offers = Offer.objects.with_current_price().order_by('pk')
+
+        for offer in offers:
+            self.assertEquals(offer.current_price(), Offer.objects.get(pk=offer.pk).current_price())
+
+    def test_with_current_price_msrp_fallback(self):
+        offers = Offer.objects.with_current_price('mxn').in_bulk([4])
+
+        self.assertEquals(offers[4].current_price('mxn'), Decimal('21.12'))
+
+    def test_with_current_price_no_extra_queries(self):
+        offers = list(Offer.objects.with_current_price().order_by('pk'))
+
+        with self.assertNumQueries(0):
+            [ (offer.current_price(), offer.savings()) for offer in offers ]
+
+class CatalogCacheTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        Offer.objects.filter(pk__in=[1, 2]).update(available=True)
+        cache.clear()
+        self.site = Site.objects.get_current()
+
+    def test_catalog_queries_do_not_grow_with_offers(self):
+        create_offers(2)
+        with self.assertNumQueries(3):
+            catalog_cache.build(self.site.pk, 'usd', timezone.now())
+
+        create_offers(10, prefix="More")
+        with self.assertNumQueries(3):
+            catalog = catalog_cache.build(self.site.pk, 'usd', timezone.now())['offers']
+
+        self.assertEquals(len(catalog), Offer.objects.filter(site=self.site, available=True).count())
+
+    def test_catalog_cached(self):
+        catalog = catalog_cache.get(self.site)
+
+        with self.assertNumQueries(0):
+            self.assertEquals(catalog_cache.get(self.site), catalog)
+
+    def test_catalog_matches_offer_methods(self):
+        offer = Offer.objects.get(pk=1)
+        entry = next(entry for entry in catalog_cache.get(self.site) if entry['pk'] == offer.pk)
+
+        self.assertEquals(entry['price'], offer.current_price())
+        self.assertEquals(entry['msrp'], offer.get_msrp())
+        self.assertEquals(entry['savings'], offer.savings())
+        self.assertEquals(entry['description'], offer.description)
+        self.assertEquals(entry['product_names'], [product.name for product in offer.products.order_by('pk')])
+
+    def test_catalog_expires_at_next_price_boundary(self):
+        start_date = timezone.now() + timedelta(hours=2)
+        Price.objects.create(offer=Offer.objects.get(pk=1), cost=0.5, start_date=start_date, priority=100)
+
+        entry = catalog_cache.build(self.site.pk, 'usd', timezone.now())
+
+        self.assertEquals(entry['expires'], start_date)
+        self.assertLessEqual(catalog_cache.get_timeout(entry, timezone.now()), 2 * 60 * 60)
+
+    def test_index_view_uses_catalog(self):
+        catalog_cache.get(self.site)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('vendor_index'))
+
+        self.assertContains(response, Offer.objects.get(pk=1).name)
+
+
 class ViewOfferTests(TestCase):
     
     fixtures = ['user', 'unit_test']
@@ -184,6 +262,58 @@ class ViewOfferTests(TestCase):
 
         self.assertContains(response, 'No Offers')
 
+    @mock.patch.object(AdminOfferListView, 'page_size', 2)
+    def test_offers_list_keyset_pages(self):
+        create_offers(3)
+        expected = list(Offer.on_site.order_by('-updated', '-pk').values_list('pk', flat=True))
+
+        pages = []
+        response = self.client.get(self.offers_list_uri)
+        pages.append([offer.pk for offer in response.context['object_list']])
+        while response.context['next_cursor']:
+            response = self.client.get(self.offers_list_uri, {'cursor': response.context['next_cursor']})
+            pages.append([offer.pk for offer in response.context['object_list']])
+
+        self.assertEquals(sum(pages, []), expected)
+        self.assertTrue(all(len(page) <= 2 for page in pages))
+
+        response = self.client.get(self.offers_list_uri, {'cursor': response.context['previous_cursor']})
+        self.assertEquals([offer.pk for offer in response.context['object_list']], pages[-2])
+
+    @mock.patch.object(AdminOfferListView, 'page_size', 2)
+    def test_offers_list_keyset_pages_same_millisecond(self):
+        offers = create_offers(6)
+        updated = timezone.now().replace(microsecond=123000)
+        for i, offer in enumerate(offers):
+            Offer.objects.filter(pk=offer.pk).update(updated=updated + timedelta(microseconds=i * 100))
+
+        pages = []
+        response = self.client.get(self.offers_list_uri)
+        pages.append([offer.pk for offer in response.context['object_list']])
+        while response.context['next_cursor']:
+            response = self.client.get(self.offers_list_uri, {'cursor': response.context['next_cursor']})
+            pages.append([offer.pk for offer in response.context['object_list']])
+
+        listed = sum(pages, [])
+        self.assertEquals(sorted(listed), sorted(Offer.on_site.values_list('pk', flat=True)))
+        self.assertEquals(len(listed), len(set(listed)))
+
+    @mock.patch.object(AdminOfferListView, 'page_size', 2)
+    def test_offers_list_keyset_page_queries_constant(self):
+        create_offers(6)
+        response = self.client.get(self.offers_list_uri)
+        cursor = response.context['next_cursor']
+
+        with self.assertNumQueries(3):
+            self.client.get(self.offers_list_uri)
+        with self.assertNumQueries(3):
+            self.client.get(self.offers_list_uri, {'cursor': cursor})
+
+    def test_offers_list_invalid_cursor(self):
+        response = self.client.get(self.offers_list_uri, {'cursor': 'not-a-cursor'})
+
+        self.assertEquals(response.status_code, 404)
+
     def test_offers_list_has_create_offer(self):
         response = self.client.get(self.offers_list_uri)
 
@@ -251,5 +381,33 @@ class ViewOfferTests(TestCase):
     # def test_create_profile_invoice_order_item_add_offer(self):
     #     raise NotImplementedError()
 
-    
-    
\ No newline at end of file
+
+class CatalogCacheInvalidationTests(TransactionTestCase):
+    '''
+    The caches are invalidated when the transaction commits, these tests commit every save.
+    '''
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        Offer.objects.filter(pk__in=[1, 2]).update(available=True)
+        cache.clear()
+        self.site = Site.objects.get_current()
+
+    def test_catalog_invalidated_by_price(self):
+        offer = Offer.objects.get(pk=1)
+        catalog_cache.get(self.site)
+
+        Price.objects.create(offer=offer, cost=0.5, start_date=timezone.now() - timedelta(days=1), priority=100)
+
+        entry = next(entry for entry in catalog_cache.get(self.site) if entry['pk'] == offer.pk)
+        self.assertEquals(entry['price'], 0.5)
+
+    def test_catalog_invalidated_by_products(self):
+        offer = Offer.objects.get(pk=1)
+        catalog_cache.get(self.site)
+
+        offer.products.add(Product.objects.exclude(offers=offer).first())
+
+        entry = next(entry for entry in catalog_cache.get(self.site) if entry['pk'] == offer.pk)
+        self.assertEquals(len(entry['product_names']), offer.products.count())
@@ -2,9 +2,11 @@ from django.contrib.auth import get_user_model
 from django.contrib.sites.models import Site
 from django.test import TestCase, Client
 from django.urls import reverse
+from decimal import Decimal, ROUND_DOWN
 
 from core.models import Product
 from vendor.models import Offer, Price, Invoice, OrderItem, Receipt, CustomerProfile
+from vendor.money import Money, to_decimal
 
 User = get_user_model()
 
@@ -28,6 +30,26 @@ class PaymentModelTests(TestCase):
         pass
     
 
+class MoneyTests(TestCase):
+
+    def test_to_decimal_rounds_floats_to_cents(self):
+        self.assertEquals(to_decimal(10.99), Decimal('10.99'))
+        self.assertEquals(to_decimal(0.1 + 0.2), Decimal('0.30'))
+        self.assertEquals(to_decimal('2.005'), Decimal('2.01'))
+        self.assertEquals(to_decimal('2.009', rounding=ROUND_DOWN), Decimal('2.00'))
+        self.assertIsNone(to_decimal(None))
+
+    def test_to_decimal_currency_exponent(self):
+        self.assertEquals(str(to_decimal(10.99, 'usd')), '10.99')
+        self.assertEquals(str(to_decimal(1500.4, 'jpy')), '1500')
+        self.assertEquals(str(to_decimal('1.2345', 'kwd')), '1.235')
+
+    def test_minor_units(self):
+        self.assertEquals(Money(10.99, 'usd').minor_units, 1099)
+        self.assertEquals(Money(1500, 'jpy').minor_units, 1500)
+        self.assertEquals(Money('1.2345', 'kwd').minor_units, 1235)
+
+
 class PaymentViewTests(TestCase):
 
     fixtures = ['user', 'unit_test']
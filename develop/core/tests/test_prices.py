@@ -1,9 +1,123 @@
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
-from django.test import TestCase, Client
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, Client
 from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+from unittest import mock
+
+from vendor.cache import PriceSchedule, price_schedule_cache
+from vendor.models import Offer, Price
+
 
 class ModelPriceTests(TestCase):
     
     def setUp(self):
         pass
+
+
+class PriceScheduleTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now()
+        self.offer = Offer.objects.get(pk=1)
+
+    def test_price_at_picks_highest_priority(self):
+        day = timedelta(days=1)
+        schedule = PriceSchedule([
+            (1, 10.0, self.now - day, None, 0),
+            (2, 8.0, self.now + day, self.now + 2 * day, 5),
+            (3, 9.0, self.now + day, self.now + 3 * day, 1),
+        ])
+
+        self.assertIsNone(schedule.price_at(self.now - 2 * day))
+        self.assertEquals(schedule.price_at(self.now), 10.0)
+        self.assertEquals(schedule.price_at(self.now + day), 8.0)
+        self.assertEquals(schedule.price_at(self.now + 2 * day), 8.0)       # end_date is inclusive
+        self.assertEquals(schedule.price_at(self.now + 2 * day + timedelta(seconds=1)), 9.0)
+        self.assertEquals(schedule.price_at(self.now + 4 * day), 10.0)
+        self.assertEquals(schedule.next_change(self.now), self.now + day)
+
+    def test_schedule_matches_active_prices(self):
+        day = timedelta(days=1)
+        Price.objects.create(offer=self.offer, cost=1.0, start_date=self.now + day, end_date=self.now + 2 * day, priority=50)
+        Price.objects.create(offer=self.offer, cost=2.0, start_date=self.now - day, end_date=self.now + 3 * day, priority=40)
+
+        for hours in range(-48, 24 * 5, 6):
+            at = self.now + timedelta(hours=hours)
+            expected = Offer.objects.with_current_price(at=at).get(pk=self.offer.pk).current_price()
+            self.assertEquals(self.offer.current_price(at=at), expected, at)
+
+    def test_schedule_matches_active_prices_on_ties(self):
+        Price.objects.create(offer=self.offer, cost=3.0, start_date=self.now - timedelta(days=1), priority=200)
+        Price.objects.create(offer=self.offer, cost=4.0, start_date=self.now - timedelta(days=1), priority=200)
+
+        expected = Offer.objects.with_current_price().get(pk=self.offer.pk).current_price()
+        self.assertEquals(self.offer.current_price(), expected)
+        self.assertEquals(expected, 3.0)
+
+    def test_schedule_built_during_invalidation_not_kept(self):
+        build = price_schedule_cache.build
+
+        def build_then_invalidate(offer_pk, currency):
+            schedule = build(offer_pk, currency)
+            price_schedule_cache.invalidate(offer_pk)       # A price saved while the schedule was being built
+            return schedule
+
+        with mock.patch.object(price_schedule_cache, 'build', side_effect=build_then_invalidate):
+            price_schedule_cache.get(self.offer.pk)
+        with mock.patch.object(price_schedule_cache, 'build', side_effect=build) as rebuild:
+            price_schedule_cache.get(self.offer.pk)
+
+        self.assertEquals(rebuild.call_count, 1)
+
+    def test_current_price_cached_schedule(self):
+        self.offer.current_price()
+
+        with self.assertNumQueries(0):
+            self.offer.current_price(at=self.now + timedelta(days=7))
+
+    def test_admin_offer_price_preview(self):
+        client = Client()
+        client.force_login(User.objects.get(pk=1))
+        Price.objects.create(offer=self.offer, cost=0.25, start_date=self.now + timedelta(days=2), end_date=self.now + timedelta(days=3), priority=100)
+
+        response = client.get(reverse('vendor_admin:manager-offer-update', kwargs={'uuid': self.offer.uuid}))
+
+        preview = response.context['price_preview']
+        self.assertEquals(preview[0][2], self.offer.current_price())
+        self.assertIn((self.now + timedelta(days=2), self.now + timedelta(days=3, microseconds=1), 0.25), preview)
+
+
+class PriceScheduleInvalidationTests(TransactionTestCase):
+    '''
+    The caches are invalidated when the transaction commits, these tests commit every save.
+    '''
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now()
+        self.offer = Offer.objects.get(pk=1)
+
+    def test_price_save_invalidates_schedule(self):
+        self.offer.current_price()
+
+        Price.objects.create(offer=self.offer, cost=0.25, start_date=self.now - timedelta(days=1), priority=100)
+
+        self.assertEquals(self.offer.current_price(), 0.25)
+
+    def test_price_save_invalidates_schedule_on_commit(self):
+        self.offer.current_price()
+
+        with transaction.atomic():
+            Price.objects.create(offer=self.offer, cost=0.25, start_date=self.now - timedelta(days=1), priority=100)
+            self.assertNotEquals(self.offer.current_price(), 0.25)
+
+        self.assertEquals(self.offer.current_price(), 0.25)
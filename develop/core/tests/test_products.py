@@ -1,12 +1,23 @@
 from django.contrib.auth import get_user_model
+import json
+import os
+import string
+import tempfile
+
 from django.contrib.sites.models import Site
+from django.core.management import call_command
 from django.core.exceptions import ValidationError
-from django.db import IntegrityError, transaction
-from django.test import TestCase, Client
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from io import StringIO
 from iso4217 import Currency
+from unittest import mock
 
-from vendor.models import generate_sku, validate_msrp_format, validate_msrp
+from vendor.cache import price_schedule_cache
+from vendor.models import generate_sku, validate_msrp_format, validate_msrp, Offer, Price
+from vendor.models.utils import random_string, reserve_skus, reserve_slugs
 
 from core.models import Product
 
@@ -58,6 +69,35 @@ class ModelProductTests(TestCase):
         self.assertNotEqual(product_a.slug, product_c.slug)
         self.assertEqual(product_a.slug, product_b.slug)
 
+    def test_reserve_slugs(self):
+        Product.objects.create(name="Reserved")
+        products = [Product(name="Reserved"), Product(name="Reserved"), Product(name="Other"), Product(name="Reserved", site=Site.objects.get(pk=2))]
+
+        with CaptureQueriesContext(connection) as queries:
+            reserve_slugs(products)
+        with self.assertNumQueries(1):
+            Product.objects.bulk_create(products)
+
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('REGEXP', queries[0]['sql'])       # Prefix matches, so the slug index can be used
+
+        self.assertEqual([product.slug for product in products], ['reserved-2', 'reserved-3', 'other', 'reserved'])
+        self.assertEqual(Product.objects.create(name="Reserved").slug, 'reserved-4')
+
+    def test_reserve_skus(self):
+        existing = Product.objects.exclude(sku=None).values_list('sku', flat=True)
+
+        with self.assertNumQueries(1):
+            skus = reserve_skus(Product, 50)
+
+        self.assertEqual(len(set(skus)), 50)
+        self.assertFalse(set(skus) & set(existing))
+
+    def test_random_string_check(self):
+        taken = [letter for letter in string.digits + string.ascii_uppercase if letter != 'A']
+
+        self.assertEqual(random_string(length=1, check=taken), 'A')
+
     def test_valid_msrp(self):
         msrp =  "JPY,10.99"
         
@@ -204,3 +244,113 @@ class ViewsProductTests(TestCase):
 
     # def test_view_warning_change_product_to_unavailable(self):
     #     raise NotImplementedError()
+
+
+class CatalogImportExportTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def export(self, model, format='jsonl'):
+        output = StringIO()
+        call_command('vendor_export', model, format=format, stdout=output)
+        return output.getvalue()
+
+    def import_rows(self, model, content, format='jsonl', **options):
+        path = self.write_file(content, format)
+        output, errors = StringIO(), StringIO()
+        call_command('vendor_import', model, path, format=format, stdout=output, stderr=errors, **options)
+        return output.getvalue(), errors.getvalue()
+
+    def write_file(self, content, format):
+        handle = tempfile.NamedTemporaryFile('w', suffix='.' + format, delete=False)
+        handle.write(content)
+        handle.close()
+        self.addCleanup(os.remove, handle.name)
+        return handle.name
+
+    def test_export_import_round_trip(self):
+        exported = {model: self.export(model, 'csv') for model in ['products', 'offers', 'prices']}
+        counts = (Product.objects.count(), Offer.objects.count(), Price.objects.count())
+        offer_products = {offer.uuid: set(offer.products.values_list('uuid', flat=True)) for offer in Offer.objects.all()}
+        self.assertEquals(len(exported['offers'].splitlines()), counts[1] + 1)
+
+        for model in ['products', 'offers', 'prices']:
+            output, errors = self.import_rows(model, exported[model], 'csv')
+            self.assertEquals(errors, "")
+            self.assertIn("Created 0", output)
+
+        self.assertEquals((Product.objects.count(), Offer.objects.count(), Price.objects.count()), counts)
+        self.assertEquals({offer.uuid: set(offer.products.values_list('uuid', flat=True)) for offer in Offer.objects.all()}, offer_products)
+
+    def test_import_creates_and_updates_products(self):
+        product = Product.objects.get(pk=1)
+        rows = [
+            {'uuid': str(product.uuid), 'name': 'Renamed'},
+            {'sku': 'IMPORT-1', 'name': 'Imported', 'available': True, 'meta': {'msrp': {'default': 'usd', 'usd': 12.5}}},
+            {'sku': 'IMPORT-2', 'name': 'Bad MSRP', 'meta': {'msrp': {'default': 'xyz'}}},
+        ]
+
+        output, errors = self.import_rows('products', "\n".join(json.dumps(row) for row in rows))
+
+        product.refresh_from_db()
+        self.assertEquals(product.name, 'Renamed')
+        self.assertEquals(Product.objects.get(sku='IMPORT-1').meta['msrp']['usd'], 12.5)
+        self.assertFalse(Product.objects.filter(sku='IMPORT-2').exists())
+        self.assertIn("Row 3", errors)
+        self.assertIn("Created 1, updated 1", output)
+
+    def test_import_offers_links_products(self):
+        products = list(Product.objects.order_by('pk')[:2])
+        row = {'name': 'Imported Bundle', 'start_date': '2020-01-01T00:00:00+00:00', 'available': True, 'products': [str(product.uuid) for product in products]}
+
+        self.import_rows('offers', json.dumps(row))
+
+        offer = Offer.objects.get(name='Imported Bundle')
+        self.assertEquals(set(offer.products.all()), set(products))
+
+        row = {'offer': str(offer.uuid), 'cost': 7.5, 'start_date': '2020-01-01T00:00:00+00:00'}
+        self.import_rows('prices', json.dumps(row))
+        self.assertEquals(offer.current_price(), 7.5)
+
+    def test_import_queries_per_chunk(self):
+        def count_queries(prefix, count):
+            rows = "\n".join(json.dumps({'name': '{} {}'.format(prefix, i % 3)}) for i in range(count))
+            with CaptureQueriesContext(connection) as queries:
+                self.import_rows('products', rows, chunk_size=count)
+            return len(queries)
+
+        self.assertEquals(count_queries('Small', 3), count_queries('Large', 30))
+        self.assertEquals(Product.objects.filter(name__startswith='Large').values('slug').distinct().count(), 30)
+
+    def test_import_dry_run(self):
+        output, errors = self.import_rows('products', json.dumps({'sku': 'DRY-1', 'name': 'Dry'}), dry_run=True)
+
+        self.assertIn("Dry run", output)
+        self.assertFalse(Product.objects.filter(sku='DRY-1').exists())
+
+
+class CatalogImportInvalidationTests(TransactionTestCase):
+    '''
+    The import invalidates the caches when its transaction commits, these tests commit it.
+    '''
+
+    fixtures = ['user', 'unit_test']
+
+    def import_prices(self, **options):
+        handle = tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False)
+        handle.write(json.dumps({'offer': str(Offer.objects.get(pk=1).uuid), 'cost': 7.5, 'start_date': '2020-01-01T00:00:00+00:00'}))
+        handle.close()
+        self.addCleanup(os.remove, handle.name)
+        call_command('vendor_import', 'prices', handle.name, stdout=StringIO(), stderr=StringIO(), **options)
+
+    def test_import_invalidates_once_after_commit(self):
+        with mock.patch.object(price_schedule_cache, 'invalidate') as invalidate:
+            self.import_prices(chunk_size=1)
+
+        invalidate.assert_called_once_with(1)
+
+    def test_import_dry_run_keeps_caches(self):
+        with mock.patch.object(price_schedule_cache, 'invalidate') as invalidate:
+            self.import_prices(dry_run=True)
+
+        invalidate.assert_not_called()
@@ -1,10 +1,16 @@
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
+from django.core.management import call_command
 from django.test import TestCase, Client
 from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+from io import StringIO
 
 from core.models import Product
-from vendor.models import Offer, Price, Invoice, OrderItem, Receipt, CustomerProfile
+from vendor.models import Offer, Price, Invoice, OrderItem, Receipt, CustomerProfile, RenewalSweep, Payment
+from vendor.models.choice import PurchaseStatus, TermType
+from vendor.renewals import RenewalSweeper
 
 class ReceiptModelTests(TestCase):
 
@@ -36,4 +42,80 @@ class ReceiptViewTests(TestCase):
     def test_view_receipt_status_code(self):
         # TODO: Implement Test
         pass
-    
\ No newline at end of file
+    
+
+
+class RenewalSweepTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        self.now = timezone.now()
+        invoice = Invoice.objects.get(pk=1)
+        offer = Offer.objects.create(name="Monthly", start_date=self.now, terms=TermType.MONTHLY_SUBSCRIPTION)
+        self.order_item = OrderItem.objects.create(invoice=invoice, offer=offer)
+        self.profile = invoice.profile
+
+    def create_receipt(self, end_date, auto_renew=False, status=PurchaseStatus.COMPLETE, subscription_id=None):
+        meta = {'subscription_id': subscription_id} if subscription_id else {}
+        return Receipt.objects.create(profile=self.profile, order_item=self.order_item, transaction='1', start_date=self.now - timedelta(days=31), end_date=end_date, auto_renew=auto_renew, status=status, meta=meta)
+
+    def create_renewal_payment(self, subscription_id, created):
+        payment = Payment.objects.create(invoice=self.order_item.invoice, transaction='2', provider='Test', amount=10, success=True, payee_full_name='Bob Ross', result={'subscription_id': subscription_id})
+        Payment.objects.filter(pk=payment.pk).update(created=created)
+
+    def test_sweep_renews_and_cancels_lapsed(self):
+        renewing = self.create_receipt(self.now + timedelta(minutes=10), auto_renew=True, subscription_id=501)
+        self.create_renewal_payment(501, self.now)
+        lapsed = self.create_receipt(self.now - timedelta(days=1))
+        ending = self.create_receipt(self.now + timedelta(minutes=10))
+        later = self.create_receipt(self.now + timedelta(days=10), auto_renew=True)
+        canceled = self.create_receipt(self.now - timedelta(days=1), auto_renew=True, status=PurchaseStatus.CANCELED)
+
+        renewal_sweep = RenewalSweeper(lookahead=60 * 60).sweep(self.now)
+
+        self.assertEquals((renewal_sweep.renewed, renewal_sweep.lapsed), (1, 1))
+        self.assertIsNotNone(renewal_sweep.finished)
+        self.assertEquals(Receipt.objects.get(pk=renewing.pk).end_date, renewing.end_date + timedelta(days=31))
+        self.assertEquals(Receipt.objects.get(pk=lapsed.pk).status, PurchaseStatus.CANCELED)
+        self.assertEquals(Receipt.objects.get(pk=ending.pk).status, PurchaseStatus.COMPLETE)
+        self.assertEquals(Receipt.objects.get(pk=later.pk).end_date, later.end_date)
+        self.assertEquals(Receipt.objects.get(pk=canceled.pk).end_date, canceled.end_date)
+
+    def test_sweep_renews_only_paid_periods(self):
+        unpaid = self.create_receipt(self.now + timedelta(minutes=10), auto_renew=True, subscription_id=502)
+        previous_period = self.create_receipt(self.now + timedelta(minutes=10), auto_renew=True, subscription_id=503)
+        self.create_renewal_payment(503, self.now - timedelta(days=30))
+        unpaid_lapsed = self.create_receipt(self.now - timedelta(minutes=10), auto_renew=True, subscription_id=504)
+
+        renewal_sweep = RenewalSweeper(lookahead=60 * 60).sweep(self.now)
+
+        self.assertEquals((renewal_sweep.renewed, renewal_sweep.lapsed), (0, 1))
+        self.assertEquals(Receipt.objects.get(pk=unpaid.pk).end_date, unpaid.end_date)
+        self.assertEquals(Receipt.objects.get(pk=previous_period.pk).end_date, previous_period.end_date)
+        self.assertEquals(Receipt.objects.get(pk=unpaid_lapsed.pk).status, PurchaseStatus.CANCELED)
+
+    def test_sweep_resumes_after_cursor(self):
+        receipts = [self.create_receipt(self.now - timedelta(days=day)) for day in range(5, 0, -1)]
+        RenewalSweep.objects.create(cursor_end_date=receipts[2].end_date, cursor_id=receipts[2].pk)
+
+        renewal_sweep = RenewalSweeper().sweep(self.now)
+
+        self.assertEquals(renewal_sweep.lapsed, 2)
+        self.assertEquals(list(Receipt.objects.filter(status=PurchaseStatus.CANCELED).order_by('end_date')), receipts[3:])
+
+    def test_sweep_queries_per_chunk(self):
+        for day in range(1, 7):
+            self.create_receipt(self.now - timedelta(days=day), auto_renew=day % 2 == 0)
+
+        # Start the sweep, then per chunk of 2: select, renewal payments, savepoint, cancel, save the cursor, release.  Then the empty select and finish.
+        with self.assertNumQueries(2 + 3 * 6 + 2):
+            RenewalSweeper(chunk_size=2).sweep(self.now)
+
+    def test_sweep_command(self):
+        self.create_receipt(self.now - timedelta(days=1))
+        output = StringIO()
+
+        call_command('vendor_sweep_renewals', stdout=output)
+
+        self.assertIn("Renewed 0 receipts, 1 lapsed", output.getvalue())
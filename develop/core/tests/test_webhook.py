@@ -0,0 +1,130 @@
+import hashlib
+import hmac
+import json
+import time
+
+from django.core.management import call_command
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from io import StringIO
+
+from vendor.models import Invoice, OrderItem, Offer, Payment, Receipt, SalesDailyAggregate, WebhookEvent
+from vendor.models.choice import PurchaseStatus
+from vendor.webhooks import WebhookEventProcessor
+
+SIGNATURE_KEY = "4A5C" * 32
+STRIPE_SECRET = "whsec_test"
+
+
+def authorizenet_event(notification_id, event_type, object_id, **payload):
+    return {'notificationId': notification_id, 'eventType': event_type, 'eventDate': '2020-01-01T00:00:00Z', 'webhookId': 'hook', 'payload': {'id': object_id, **payload}}
+
+
+@override_settings(AUTHORIZE_NET_SIGNATURE_KEY=SIGNATURE_KEY, STRIPE_WEBHOOK_SECRET=STRIPE_SECRET)
+class WebhookTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        self.client = Client()
+
+    def post_authorizenet(self, event, key=SIGNATURE_KEY):
+        body = json.dumps(event).encode('utf-8')
+        signature = "sha512=" + hmac.new(bytes.fromhex(key), body, hashlib.sha512).hexdigest().upper()
+        return self.client.post(reverse('vendor:webhook', kwargs={'provider': 'authorizenet'}), body, content_type='application/json', HTTP_X_ANET_SIGNATURE=signature)
+
+    def post_stripe(self, event, timestamp=None):
+        body = json.dumps(event).encode('utf-8')
+        timestamp = str(int(timestamp or time.time()))
+        signature = hmac.new(STRIPE_SECRET.encode('utf-8'), timestamp.encode('utf-8') + b'.' + body, hashlib.sha256).hexdigest()
+        return self.client.post(reverse('vendor:webhook', kwargs={'provider': 'stripe'}), body, content_type='application/json', HTTP_STRIPE_SIGNATURE="t={},v1={}".format(timestamp, signature))
+
+    def test_receive_stores_event_once(self):
+        event = authorizenet_event('n-1', 'net.authorize.payment.authcapture.created', '101', responseCode=1)
+
+        with self.assertNumQueries(1):
+            response = self.post_authorizenet(event)
+        resent = self.post_authorizenet(event)
+
+        self.assertEquals((response.status_code, resent.status_code), (200, 200))
+        stored = WebhookEvent.objects.get()
+        self.assertEquals((stored.provider, stored.event_id, stored.event_type), ('AuthorizeNetProcessor', 'n-1', 'net.authorize.payment.authcapture.created'))
+        self.assertIsNone(stored.processed)
+
+    def test_receive_refuses_invalid_signatures(self):
+        self.assertEquals(self.post_authorizenet(authorizenet_event('n-1', 'net.authorize.payment.void.created', '101'), key="00" * 64).status_code, 403)
+        self.assertEquals(self.post_stripe({'id': 'evt_1', 'type': 'charge.refunded', 'data': {'object': {'id': 'ch_1'}}}, timestamp=time.time() - 60 * 60).status_code, 403)
+        self.assertEquals(self.client.post(reverse('vendor:webhook', kwargs={'provider': 'unknown'}), b'{}', content_type='application/json').status_code, 404)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_process_events_in_batches(self):
+        invoice = Invoice.objects.get(pk=1)
+        captured = Payment.objects.create(invoice=invoice, transaction='101', provider='AuthorizeNetProcessor', amount=10, success=False, payee_full_name='Bob Ross')
+        voided = Payment.objects.create(invoice=invoice, transaction='102', provider='AuthorizeNetProcessor', amount=10, success=True, payee_full_name='Bob Ross')
+
+        refunded = Invoice.objects.create(profile=invoice.profile, status=Invoice.InvoiceStatus.COMPLETE)
+        OrderItem.objects.create(invoice=refunded, offer=Offer.objects.get(pk=4), unit_price=10)
+        Payment.objects.create(invoice=refunded, transaction='ch_1', provider='StripeProcessor', amount=10, success=True, payee_full_name='Bob Ross')
+
+        order_item = OrderItem.objects.create(invoice=invoice, offer=Offer.objects.get(pk=4), unit_price=10)
+        subscription = Receipt.objects.create(profile=invoice.profile, order_item=order_item, transaction='101', status=PurchaseStatus.COMPLETE, meta={'subscription_id': 501})
+
+        self.post_authorizenet(authorizenet_event('n-1', 'net.authorize.payment.authcapture.created', '101', responseCode=1))
+        self.post_authorizenet(authorizenet_event('n-2', 'net.authorize.payment.void.created', '102'))
+        self.post_authorizenet(authorizenet_event('n-3', 'net.authorize.customer.subscription.cancelled', '501'))
+        self.post_authorizenet(authorizenet_event('n-4', 'net.authorize.payment.fraud.held', '103'))
+        self.post_stripe({'id': 'evt_1', 'type': 'charge.refunded', 'data': {'object': {'id': 'ch_1', 'refunded': True}}})
+
+        processed = WebhookEventProcessor(batch_size=2).process()
+
+        self.assertEquals(processed, 5)
+        self.assertFalse(WebhookEvent.objects.pending().exists())
+        self.assertTrue(Payment.objects.get(pk=captured.pk).success)
+        self.assertFalse(Payment.objects.get(pk=voided.pk).success)
+        self.assertEquals(Receipt.objects.get(pk=subscription.pk).status, PurchaseStatus.CANCELED)
+        self.assertEquals(Invoice.objects.get(pk=refunded.pk).status, Invoice.InvoiceStatus.REFUNDED)
+        self.assertEquals(SalesDailyAggregate.objects.get(offer_id=4).refunds, 10)
+
+    def test_process_refund_cancels_receipts(self):
+        invoice = Invoice.objects.get(pk=1)
+        refunded = Invoice.objects.create(profile=invoice.profile, status=Invoice.InvoiceStatus.COMPLETE)
+        order_item = OrderItem.objects.create(invoice=refunded, offer=Offer.objects.get(pk=4), unit_price=10)
+        Payment.objects.create(invoice=refunded, transaction='ch_2', provider='StripeProcessor', amount=10, success=True, payee_full_name='Bob Ross')
+        receipt = Receipt.objects.create(profile=invoice.profile, order_item=order_item, transaction='ch_2', status=PurchaseStatus.COMPLETE)
+        other_receipt = Receipt.objects.create(profile=invoice.profile, order_item=OrderItem.objects.filter(invoice=invoice).first(), transaction='1', status=PurchaseStatus.COMPLETE)
+        self.post_stripe({'id': 'evt_2', 'type': 'charge.refunded', 'data': {'object': {'id': 'ch_2', 'refunded': True}}})
+
+        events = list(WebhookEvent.objects.pending())
+        profile_ids = WebhookEventProcessor().apply(events, timezone.now())
+
+        self.assertEquals(profile_ids, {invoice.profile_id})
+        self.assertEquals(Invoice.objects.get(pk=refunded.pk).status, Invoice.InvoiceStatus.REFUNDED)
+        self.assertEquals(Receipt.objects.get(pk=receipt.pk).status, PurchaseStatus.CANCELED)
+        self.assertEquals(Receipt.objects.get(pk=other_receipt.pk).status, PurchaseStatus.COMPLETE)
+
+    def test_process_partial_refund_keeps_invoice(self):
+        invoice = Invoice.objects.get(pk=1)
+        refunded = Invoice.objects.create(profile=invoice.profile, status=Invoice.InvoiceStatus.COMPLETE)
+        order_item = OrderItem.objects.create(invoice=refunded, offer=Offer.objects.get(pk=4), unit_price=10)
+        Payment.objects.create(invoice=refunded, transaction='ch_3', provider='StripeProcessor', amount=10, success=True, payee_full_name='Bob Ross')
+        receipt = Receipt.objects.create(profile=invoice.profile, order_item=order_item, transaction='ch_3', status=PurchaseStatus.COMPLETE)
+        self.post_stripe({'id': 'evt_3', 'type': 'charge.refunded', 'data': {'object': {'id': 'ch_3', 'amount': 1000, 'amount_refunded': 400, 'refunded': False}}})
+
+        processed = WebhookEventProcessor().process()
+
+        self.assertEquals(processed, 1)
+        self.assertEquals(Invoice.objects.get(pk=refunded.pk).status, Invoice.InvoiceStatus.COMPLETE)
+        self.assertEquals(Receipt.objects.get(pk=receipt.pk).status, PurchaseStatus.COMPLETE)
+        self.assertFalse(SalesDailyAggregate.objects.filter(refunds__gt=0).exists())
+
+    def test_process_records_invalid_events(self):
+        WebhookEvent.objects.create(provider='AuthorizeNetProcessor', event_id='n-1', event_type='net.authorize.payment.void.created', payload={})
+
+        out = StringIO()
+        call_command('vendor_process_webhooks', stdout=out)
+
+        event = WebhookEvent.objects.get()
+        self.assertIsNotNone(event.processed)
+        self.assertIn("Invalid event", event.error)
+        self.assertIn("Processed 1 webhook events", out.getvalue())
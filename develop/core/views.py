@@ -4,6 +4,7 @@ from django.views.generic.list import ListView
 from django.contrib.sites.models import Site
 
 # from vendor.mixins import UserOwnsProductMixin
+from vendor.cache import catalog_cache
 from vendor.models import Offer
 from vendor.views.mixin import ProductRequiredMixin
 
@@ -12,6 +13,9 @@ class VendorIndexView(ListView):
     template_name = "core/index.html"
     model = Offer
 
+    def get_queryset(self):
+        return catalog_cache.get(Site.objects.get_current())
+
 
 class ProductAccessView(ProductRequiredMixin, TemplateView):
     model = Offer
@@ -181,10 +181,12 @@ AUTHORIZE_NET_API_ID = os.getenv("AUTHORIZE_NET_API_ID")
 AUTHORIZE_NET_TRANSACTION_KEY = os.getenv("AUTHORIZE_NET_TRANSACTION_KEY")
 AUTHORIZE_NET_KEY = os.getenv("AUTHORIZE_NET_KEY")
 AUTHOIRZE_NET_TRANSACTION_TYPE_DEFAULT = os.getenv("AUTHOIRZE_NET_TRANSACTION_TYPE_DEFAULT")
+AUTHORIZE_NET_SIGNATURE_KEY = os.getenv("AUTHORIZE_NET_SIGNATURE_KEY")
 
 # Stripe Settings
 STRIPE_TEST_SECRET_KEY = os.getenv("STRIPE_TEST_SECRET_KEY")
 STRIPE_TEST_PUBLIC_KEY = os.getenv("STRIPE_TEST_PUBLIC_KEY")
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 STRIPE_LIVE_MODE = False
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")